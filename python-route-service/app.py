@@ -7,12 +7,14 @@ Provides realistic maritime routing that follows shipping lanes and avoids land
 import os
 import sys
 import asyncio
+import math
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import searoute as sr
 import json
 from datetime import datetime, timedelta
 from port_service import find_port_coordinates, get_port_service
+from route_index import get_route_index, parse_time, WORLD_BBOX
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for frontend access
@@ -81,6 +83,7 @@ def calculate_route():
         end_lng = float(data.get('end_lng', 0))
         destination = data.get('destination', '')
         vessel_speed = float(data.get('speed', 15))  # knots
+        vessel_id = data.get('vessel_id')  # Optional, enables /routes/query
 
         # If no end coordinates provided, try to find them from destination
         if (end_lat == 0 and end_lng == 0) and destination:
@@ -149,6 +152,14 @@ def calculate_route():
                 route_duration_hours = total_distance_nm / vessel_speed if vessel_speed > 0 else 0
                 estimated_arrival = current_time + timedelta(hours=route_duration_hours)
 
+                # Keep the corridor index current; a recomputed route replaces the old one
+                # Indexing problems must not fail an otherwise valid route
+                if vessel_id:
+                    try:
+                        get_route_index().update_route(str(vessel_id), waypoints)
+                    except Exception as index_error:
+                        print(f"Route indexing error for vessel {vessel_id}: {index_error}")
+
                 response = {
                     "success": True,
                     "route": {
@@ -165,6 +176,7 @@ def calculate_route():
                     "metadata": {
                         "route_type": "maritime",
                         "calculation_method": "searoute",
+                        "vessel_id": vessel_id,
                         "timestamp": datetime.now().isoformat()
                     }
                 }
@@ -185,6 +197,56 @@ def calculate_route():
         print(f"Route calculation error: {e}")
         return jsonify({"error": f"Route calculation failed: {str(e)}"}), 500
 
+@app.route('/routes/query', methods=['GET'])
+def query_routes():
+    """Find vessels whose indexed routes pass through a bounding box in a time window"""
+    try:
+        bbox_param = request.args.get('bbox', '')
+        try:
+            min_lng, min_lat, max_lng, max_lat = (float(v) for v in bbox_param.split(','))
+        except ValueError:
+            return jsonify({"error": "bbox must be min_lng,min_lat,max_lng,max_lat"}), 400
+
+        if not all(math.isfinite(v) for v in (min_lng, min_lat, max_lng, max_lat)):
+            return jsonify({"error": "bbox values must be finite numbers"}), 400
+
+        world_min_lng, world_min_lat, world_max_lng, world_max_lat = WORLD_BBOX
+        if not (world_min_lng <= min_lng <= world_max_lng and world_min_lng <= max_lng <= world_max_lng):
+            return jsonify({"error": "bbox longitudes must be between -180 and 180"}), 400
+        if not (world_min_lat <= min_lat <= world_max_lat and world_min_lat <= max_lat <= world_max_lat):
+            return jsonify({"error": "bbox latitudes must be between -90 and 90"}), 400
+
+        if min_lng > max_lng or min_lat > max_lat:
+            return jsonify({"error": "bbox minimums must not exceed maximums"}), 400
+
+        try:
+            start = parse_time(request.args['from']) if request.args.get('from') else datetime.now()
+            end = parse_time(request.args['to']) if request.args.get('to') else start + timedelta(hours=48)
+        except ValueError:
+            return jsonify({"error": "from and to must be ISO 8601 timestamps"}), 400
+
+        if end < start:
+            return jsonify({"error": "to must not be earlier than from"}), 400
+
+        route_index = get_route_index()
+        vessels = route_index.query((min_lng, min_lat, max_lng, max_lat), start, end)
+
+        return jsonify({
+            "success": True,
+            "vessels": vessels,
+            "count": len(vessels),
+            "query": {
+                "bbox": [min_lng, min_lat, max_lng, max_lat],
+                "from": start.isoformat(),
+                "to": end.isoformat()
+            },
+            "index": route_index.stats()
+        })
+
+    except Exception as e:
+        print(f"Route query error: {e}")
+        return jsonify({"error": f"Route query failed: {str(e)}"}), 500
+
 @app.route('/ports', methods=['GET'])
 def list_ports():
     """Get list of available ports with coordinates"""
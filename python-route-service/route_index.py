@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Time-aware spatial index over active vessel routes
+
+Route segments computed by the /route endpoint are bucketed into a uniform
+lat/lng grid and annotated with their ETA interval, so corridor queries
+("which vessels cross this box between T1 and T2") only touch the cells the
+box overlaps instead of every waypoint of every route.
+"""
+
+import heapq
+import math
+import threading
+import time
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Grid cell size in degrees. Long legs are walked in cell-sized steps, so a
+# segment is stored in roughly as many cells as its length spans.
+DEFAULT_CELL_SIZE_DEG = 1.0
+
+# Valid query extent; anything outside is rejected by the /routes/query endpoint
+WORLD_BBOX = (-180.0, -90.0, 180.0, 90.0)
+
+# (lat1, lng1, t1, lat2, lng2, t2) with times as POSIX timestamps
+Segment = Tuple[float, float, float, float, float, float]
+BBox = Tuple[float, float, float, float]  # (min_lng, min_lat, max_lng, max_lat)
+
+
+def parse_time(value: str) -> datetime:
+    """Parse an ISO 8601 timestamp into a naive local datetime
+
+    Route ETAs are generated from datetime.now(), so timezone-aware input is
+    converted to local time before comparison.
+    """
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def _normalize_lng(lng: float) -> float:
+    """Wrap a longitude into [-180, 180)
+
+    searoute keeps counting past 180 on trans-Pacific routes (e.g. 237 for
+    San Francisco), so its output has to be wrapped before indexing.
+    """
+    return ((lng + 180.0) % 360.0) - 180.0
+
+
+def _split_antimeridian(lat1: float, lng1: float, t1: float,
+                        lat2: float, lng2: float, t2: float) -> List[Segment]:
+    """Split a segment that wraps across +/-180 longitude into two pieces"""
+    if abs(lng2 - lng1) <= 180:
+        return [(lat1, lng1, t1, lat2, lng2, t2)]
+
+    # Unwrap the second point so the segment is continuous, then cut at the edge
+    unwrapped_lng2 = lng2 + 360 if lng2 < lng1 else lng2 - 360
+    edge = 180.0 if unwrapped_lng2 > lng1 else -180.0
+    frac = (edge - lng1) / (unwrapped_lng2 - lng1)
+    lat_edge = lat1 + (lat2 - lat1) * frac
+    t_edge = t1 + (t2 - t1) * frac
+    return [
+        (lat1, lng1, t1, lat_edge, edge, t_edge),
+        (lat_edge, -edge, t_edge, lat2, lng2, t2),
+    ]
+
+
+def _clip_segment(seg: Segment, bbox: BBox) -> Optional[Tuple[float, float]]:
+    """Clip a segment to a bounding box (Liang-Barsky)
+
+    Returns the (enter, exit) fractions along the segment, or None if the
+    segment does not intersect the box.
+    """
+    lat1, lng1, _, lat2, lng2, _ = seg
+    min_lng, min_lat, max_lng, max_lat = bbox
+    d_lng = lng2 - lng1
+    d_lat = lat2 - lat1
+    t_enter, t_exit = 0.0, 1.0
+
+    for p, q in ((-d_lng, lng1 - min_lng), (d_lng, max_lng - lng1),
+                 (-d_lat, lat1 - min_lat), (d_lat, max_lat - lat1)):
+        if p == 0:
+            if q < 0:
+                return None
+            continue
+        r = q / p
+        if p < 0:
+            t_enter = max(t_enter, r)
+        else:
+            t_exit = min(t_exit, r)
+        if t_enter > t_exit:
+            return None
+
+    return t_enter, t_exit
+
+
+class RouteIndex:
+    def __init__(self, cell_size: float = DEFAULT_CELL_SIZE_DEG):
+        """Initialize an empty grid index"""
+        self.cell_size = cell_size
+        self._lock = threading.Lock()
+        # Highest grid column/row inside WORLD_BBOX; points on the +180/+90
+        # edge fold into the last cell instead of opening one past it
+        self._max_col = math.ceil(WORLD_BBOX[2] / cell_size) - 1
+        self._max_row = math.ceil(WORLD_BBOX[3] / cell_size) - 1
+        # vessel_id -> list of route segments, in sailing order
+        self._routes: Dict[str, List[Segment]] = {}
+        # vessel_id -> grid cells holding that vessel's segments
+        self._vessel_cells: Dict[str, Set[Tuple[int, int]]] = {}
+        # grid cell -> vessel_id -> indices into that vessel's segment list
+        self._cells: Dict[Tuple[int, int], Dict[str, List[int]]] = {}
+        # vessel_id -> last ETA on its route, with a min-heap for expiry.
+        # The heap may hold stale entries for replaced routes; they are
+        # skipped when popped.
+        self._arrivals: Dict[str, float] = {}
+        self._expiry_heap: List[Tuple[float, str]] = []
+
+    def _cell_range(self, min_lng: float, min_lat: float,
+                    max_lng: float, max_lat: float):
+        """Yield every grid cell overlapping the given extent"""
+        size = self.cell_size
+        max_i = min(math.floor(max_lng / size), self._max_col)
+        max_j = min(math.floor(max_lat / size), self._max_row)
+        for i in range(min(math.floor(min_lng / size), max_i), max_i + 1):
+            for j in range(min(math.floor(min_lat / size), max_j), max_j + 1):
+                yield i, j
+
+    def _segment_cells(self, lng1: float, lat1: float, lng2: float, lat2: float):
+        """Get the grid cells a segment passes through
+
+        The segment is walked in steps no longer than one cell, and each step
+        covers at most a 2x2 block, so long diagonal legs do not fill their
+        whole bounding rectangle.
+        """
+        size = self.cell_size
+        steps = max(1, math.ceil(max(abs(lng2 - lng1), abs(lat2 - lat1)) / size))
+        cells: Set[Tuple[int, int]] = set()
+        prev_lng, prev_lat = lng1, lat1
+        for k in range(1, steps + 1):
+            frac = k / steps
+            next_lng = lng1 + (lng2 - lng1) * frac
+            next_lat = lat1 + (lat2 - lat1) * frac
+            cells.update(self._cell_range(min(prev_lng, next_lng), min(prev_lat, next_lat),
+                                          max(prev_lng, next_lng), max(prev_lat, next_lat)))
+            prev_lng, prev_lat = next_lng, next_lat
+        return cells
+
+    def _prune_locked(self, now: float):
+        """Drop routes whose last ETA is in the past; caller holds the lock"""
+        while self._expiry_heap and self._expiry_heap[0][0] < now:
+            arrival, vessel_id = heapq.heappop(self._expiry_heap)
+            if self._arrivals.get(vessel_id) == arrival:
+                self._remove_locked(vessel_id)
+                logger.info(f"Expired completed route for vessel {vessel_id}")
+
+        # Rebuild the heap if replaced routes have left it mostly stale
+        if len(self._expiry_heap) > 2 * len(self._arrivals) + 64:
+            self._expiry_heap = [(arrival, vessel_id) for vessel_id, arrival in self._arrivals.items()]
+            heapq.heapify(self._expiry_heap)
+
+    def _remove_locked(self, vessel_id: str):
+        """Drop a vessel's segments from the grid; caller holds the lock"""
+        for cell in self._vessel_cells.pop(vessel_id, ()):
+            bucket = self._cells.get(cell)
+            if bucket is None:
+                continue
+            bucket.pop(vessel_id, None)
+            if not bucket:
+                del self._cells[cell]
+        self._routes.pop(vessel_id, None)
+        self._arrivals.pop(vessel_id, None)
+
+    def update_route(self, vessel_id: str, waypoints: List[Dict]) -> int:
+        """Insert or replace a vessel's route
+
+        Waypoints use the /route response shape (lat, lng, estimated_time).
+        Returns the number of segments indexed.
+        """
+        points = [
+            (float(wp['lat']), _normalize_lng(float(wp['lng'])), parse_time(wp['estimated_time']).timestamp())
+            for wp in waypoints
+        ]
+
+        segments: List[Segment] = []
+        for (lat1, lng1, t1), (lat2, lng2, t2) in zip(points, points[1:]):
+            segments.extend(_split_antimeridian(lat1, lng1, t1, lat2, lng2, t2))
+
+        with self._lock:
+            self._prune_locked(time.time())
+            self._remove_locked(vessel_id)
+            if not segments:
+                return 0
+
+            cells: Set[Tuple[int, int]] = set()
+            for index, (lat1, lng1, _, lat2, lng2, _) in enumerate(segments):
+                for cell in self._segment_cells(lng1, lat1, lng2, lat2):
+                    self._cells.setdefault(cell, {}).setdefault(vessel_id, []).append(index)
+                    cells.add(cell)
+
+            arrival = segments[-1][5]
+            self._routes[vessel_id] = segments
+            self._vessel_cells[vessel_id] = cells
+            self._arrivals[vessel_id] = arrival
+            heapq.heappush(self._expiry_heap, (arrival, vessel_id))
+
+        logger.info(f"Indexed {len(segments)} route segments for vessel {vessel_id}")
+        return len(segments)
+
+    def query(self, bbox: BBox, start: datetime, end: datetime) -> List[Dict]:
+        """Find vessels whose route passes through bbox between start and end
+
+        Each result lists the contiguous passes through the box with their
+        entry and exit times; passes entirely outside the window are skipped.
+        The box is clamped to WORLD_BBOX so the cell scan stays bounded.
+        """
+        min_lng = max(bbox[0], WORLD_BBOX[0])
+        min_lat = max(bbox[1], WORLD_BBOX[1])
+        max_lng = min(bbox[2], WORLD_BBOX[2])
+        max_lat = min(bbox[3], WORLD_BBOX[3])
+        bbox = (min_lng, min_lat, max_lng, max_lat)
+        window_start = start.timestamp()
+        window_end = end.timestamp()
+
+        # Clip candidates under the lock so a concurrent update cannot swap
+        # a vessel's segment list between the cell lookup and the read
+        hits: Dict[str, List[Tuple[int, float, float, bool, bool]]] = {}
+        with self._lock:
+            self._prune_locked(time.time())
+            candidates: Dict[str, Set[int]] = {}
+            for cell in self._cell_range(min_lng, min_lat, max_lng, max_lat):
+                for vessel_id, indices in self._cells.get(cell, {}).items():
+                    candidates.setdefault(vessel_id, set()).update(indices)
+
+            for vessel_id, indices in candidates.items():
+                segments = self._routes[vessel_id]
+                for index in sorted(indices):
+                    seg = segments[index]
+                    clipped = _clip_segment(seg, bbox)
+                    if clipped is None:
+                        continue
+                    f_enter, f_exit = clipped
+                    t1, t2 = seg[2], seg[5]
+                    entry = t1 + (t2 - t1) * f_enter
+                    exit_ = t1 + (t2 - t1) * f_exit
+                    hits.setdefault(vessel_id, []).append(
+                        (index, entry, exit_, f_enter == 0.0, f_exit == 1.0)
+                    )
+
+        results = []
+        for vessel_id, vessel_hits in hits.items():
+            # Merge consecutive segments that stay inside the box across
+            # their shared waypoint into a single pass
+            passes: List[List[float]] = []
+            prev_index, prev_ends_inside = None, False
+            for index, entry, exit_, starts_inside, ends_inside in vessel_hits:
+                if passes and prev_index == index - 1 and prev_ends_inside and starts_inside:
+                    passes[-1][1] = exit_
+                else:
+                    passes.append([entry, exit_])
+                prev_index, prev_ends_inside = index, ends_inside
+
+            passes = [p for p in passes if p[0] <= window_end and p[1] >= window_start]
+            if not passes:
+                continue
+
+            results.append({
+                "vessel_id": vessel_id,
+                "entry_time": datetime.fromtimestamp(passes[0][0]).isoformat(),
+                "exit_time": datetime.fromtimestamp(passes[-1][1]).isoformat(),
+                "passes": [
+                    {
+                        "entry_time": datetime.fromtimestamp(entry).isoformat(),
+                        "exit_time": datetime.fromtimestamp(exit_).isoformat(),
+                    }
+                    for entry, exit_ in passes
+                ],
+            })
+
+        results.sort(key=lambda r: r["entry_time"])
+        return results
+
+    def stats(self) -> Dict[str, int]:
+        """Get index size counters"""
+        with self._lock:
+            self._prune_locked(time.time())
+            return {
+                "vessels": len(self._routes),
+                "segments": sum(len(s) for s in self._routes.values()),
+                "cells": len(self._cells),
+            }
+
+# Global route index instance
+_route_index = None
+
+def get_route_index() -> RouteIndex:
+    """Get the global route index instance"""
+    global _route_index
+    if _route_index is None:
+        _route_index = RouteIndex()
+    return _route_index
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Tests for the time-aware route index and the /routes/query endpoint
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from route_index import RouteIndex, _clip_segment, _split_antimeridian
+
+NOW = datetime.now().replace(microsecond=0)
+WINDOW = (NOW, NOW + timedelta(hours=48))
+
+
+def make_waypoints(points):
+    """Build /route style waypoints from (lat, lng, hours_from_now) tuples"""
+    return [
+        {"lat": lat, "lng": lng, "estimated_time": (NOW + timedelta(hours=hours)).isoformat()}
+        for lat, lng, hours in points
+    ]
+
+
+def at(hours):
+    return (NOW + timedelta(hours=hours)).isoformat()
+
+
+def test_clip_diagonal_segment():
+    seg = (0.0, 0.0, 0.0, 10.0, 10.0, 10.0)
+    f_enter, f_exit = _clip_segment(seg, (2.0, 2.0, 4.0, 4.0))
+    assert f_enter == pytest.approx(0.2)
+    assert f_exit == pytest.approx(0.4)
+
+    assert _clip_segment(seg, (6.0, 0.0, 10.0, 3.0)) is None
+
+
+def test_split_antimeridian_segment():
+    pieces = _split_antimeridian(5.0, 179.0, 0.0, 7.0, -179.0, 100.0)
+    assert len(pieces) == 2
+    first, second = pieces
+    assert first[:2] == (5.0, 179.0)
+    assert first[4] == 180.0
+    assert second[1] == -180.0
+    assert second[3:5] == (7.0, -179.0)
+    # Cut happens halfway along in both position and time
+    assert first[3] == pytest.approx(6.0)
+    assert first[5] == pytest.approx(50.0)
+    assert second[2] == pytest.approx(50.0)
+
+
+def test_antimeridian_route_is_found_on_both_sides():
+    index = RouteIndex()
+    index.update_route("B", make_waypoints([(5, 179, 0), (5, -179, 2)]))
+
+    east = index.query((-180, 4, -178, 6), *WINDOW)
+    west = index.query((178, 4, 180, 6), *WINDOW)
+    assert [r["vessel_id"] for r in east] == ["B"]
+    assert [r["vessel_id"] for r in west] == ["B"]
+
+
+def test_unwrapped_searoute_longitudes_are_normalized():
+    index = RouteIndex()
+    # searoute continues past 180 instead of wrapping (Tokyo -> San Francisco)
+    index.update_route("P", make_waypoints([(35, 170, 0), (37, 190, 2), (38, 237, 4)]))
+
+    assert [r["vessel_id"] for r in index.query((-125, 35, -120, 40), *WINDOW)] == ["P"]
+    assert [r["vessel_id"] for r in index.query((-180, 30, -150, 60), *WINDOW)] == ["P"]
+    assert [r["vessel_id"] for r in index.query((160, 30, 180, 60), *WINDOW)] == ["P"]
+    assert index.stats()["cells"] > 0
+    assert all(-180 <= i < 180 for i, _ in index._cells)
+
+
+def test_consecutive_segments_merge_into_one_pass():
+    index = RouteIndex()
+    index.update_route("A", make_waypoints([(0, 0, 0), (0, 2, 2), (0, 4, 4), (0, 6, 6), (0, 20, 20)]))
+
+    results = index.query((1, -1, 7, 1), *WINDOW)
+    assert len(results) == 1
+    result = results[0]
+    assert len(result["passes"]) == 1
+    assert result["entry_time"] == at(1)
+    assert result["exit_time"] == at(7)
+
+
+def test_separate_visits_are_separate_passes():
+    index = RouteIndex()
+    index.update_route("A", make_waypoints([(0, 0, 0), (0, 10, 10), (5, 10, 15), (5, 0, 25)]))
+
+    result = index.query((4, -1, 6, 6), *WINDOW)[0]
+    assert [(p["entry_time"], p["exit_time"]) for p in result["passes"]] == [
+        (at(4), at(6)),
+        (at(19), at(21)),
+    ]
+
+
+def test_recomputed_route_replaces_old_one():
+    index = RouteIndex()
+    index.update_route("A", make_waypoints([(0, 0, 0), (0, 10, 10)]))
+    index.update_route("A", make_waypoints([(30, 0, 0), (30, 10, 10)]))
+
+    assert index.query((4, -1, 6, 1), *WINDOW) == []
+    assert [r["vessel_id"] for r in index.query((4, 29, 6, 31), *WINDOW)] == ["A"]
+    assert index.stats()["vessels"] == 1
+
+
+def test_passes_outside_time_window_are_excluded():
+    index = RouteIndex()
+    index.update_route("A", make_waypoints([(0, 0, 0), (0, 100, 100)]))
+
+    assert index.query((4, -1, 6, 1), NOW + timedelta(hours=10), NOW + timedelta(hours=20)) == []
+    assert len(index.query((4, -1, 6, 1), NOW + timedelta(hours=5), NOW + timedelta(hours=20))) == 1
+
+
+def test_completed_routes_expire():
+    index = RouteIndex()
+    index.update_route("done", make_waypoints([(0, 0, -10), (0, 10, -1)]))
+    index.update_route("active", make_waypoints([(0, 0, 0), (0, 10, 10)]))
+
+    assert index.stats()["vessels"] == 1
+    assert [r["vessel_id"] for r in index.query((-1, -1, 11, 1), NOW - timedelta(hours=10), NOW)] == ["active"]
+
+
+def test_long_leg_only_indexes_cells_it_crosses():
+    index = RouteIndex()
+    index.update_route("A", make_waypoints([(0, 0, 0), (40, 40, 40)]))
+
+    # A bounding-rectangle fill would be 41 * 41 cells
+    assert index.stats()["cells"] < 200
+    assert index.query((30, 5, 35, 10), *WINDOW) == []
+    assert len(index.query((19.5, 19.5, 20.5, 20.5), *WINDOW)) == 1
+
+
+@pytest.fixture
+def client():
+    pytest.importorskip("flask")
+    from app import app
+    app.config["TESTING"] = True
+    return app.test_client()
+
+
+@pytest.mark.parametrize("bbox", [
+    "",
+    "1,2,3",
+    "a,b,c,d",
+    "nan,0,1,1",
+    "0,0,inf,1",
+    "-1000000,-1000000,1000000,1000000",
+    "0,-91,1,1",
+    "-181,0,1,1",
+    "5,0,1,1",
+])
+def test_query_rejects_invalid_bbox(client, bbox):
+    response = client.get("/routes/query", query_string={"bbox": bbox})
+    assert response.status_code == 400
+
+
+def test_query_accepts_world_bbox(client):
+    response = client.get("/routes/query", query_string={"bbox": "-180,-90,180,90"})
+    assert response.status_code == 200
+    assert response.get_json()["success"] is True
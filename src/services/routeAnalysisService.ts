@@ -1,4 +1,5 @@
 interface Vessel {
+  id?: string;
   latitude: number;
   longitude: number;
   course: number;
@@ -187,7 +188,8 @@ export const fetchMaritimeRoute = async (vessel: Vessel): Promise<{route: RouteP
         end_lat: destinationCoords.lat,
         end_lng: destinationCoords.lng,
         destination: destinationToUse,
-        speed: vessel.speed
+        speed: vessel.speed,
+        vessel_id: vessel.id
       })
     });
 